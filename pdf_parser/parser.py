@@ -1,67 +1,393 @@
 #!/usr/bin/env python
-from typing import List, Union
+from __future__ import annotations
+from typing import TYPE_CHECKING, List, Union
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import hashlib
+import os
 import pathlib
-import fitz
-import pymupdf4llm
+import pickle
+import tempfile
+import threading
 import argparse
 import sys
+import warnings
 
-def parse_pdf_to_markdown(
+# fitz and pymupdf4llm are imported where they are used so that `--help`, argument
+# errors and plain package imports do not pay for loading MuPDF.
+if TYPE_CHECKING:
+    import fitz
+
+# Named resolutions for extracted images; rendering cost grows with dpi².
+DPI_PRESETS = {"web": 96, "screen": 150, "print": 300}
+
+# Location of cached extraction results (see `use_cache`).
+CACHE_DIR = pathlib.Path.home() / ".cache" / "pymupdf4llm"
+
+def _cache_file(pdf_path: str, options: dict) -> pathlib.Path:
+    """
+    Return the cache location for a PDF and set of options.
+    The key includes mtime and size so edits to the file invalidate it, and the
+    pymupdf4llm version so a library upgrade does not serve stale output.
+    """
+    import pymupdf4llm
+
+    st = os.stat(pdf_path)
+    raw = (
+        f"{os.path.abspath(pdf_path)}|{st.st_mtime_ns}|{st.st_size}|"
+        f"{pymupdf4llm.__version__}|{sorted(options.items())}"
+    )
+    key = hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+    return CACHE_DIR / f"{key}.pkl"
+
+def _write_cache(cache_file: pathlib.Path, md_output: Union[str, List[dict]]) -> None:
+    """
+    Atomically store a result so concurrent readers never see a partial file.
+    """
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=cache_file.parent, delete=False) as tmp:
+        try:
+            pickle.dump(md_output, tmp)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    os.replace(tmp.name, cache_file)
+
+def _read_cache(cache_file: pathlib.Path) -> Union[str, List[dict], None]:
+    """
+    Load a cached result, treating a missing, truncated or corrupt entry as a miss.
+    """
+    try:
+        return pickle.loads(cache_file.read_bytes())
+    except Exception:
+        return None
+
+IMAGE_COLORSPACES = ("rgb", "gray", "auto")
+
+MODES = ("markdown", "plain")
+
+def _is_grayscale(pix: fitz.Pixmap, samples: int = 16, tolerance: int = 4) -> bool:
+    """
+    Check a grid of pixels and report whether R, G and B agree everywhere.
+    """
+    if pix.n - pix.alpha < 3:
+        return True
+    for y in range(0, pix.height, max(1, pix.height // samples)):
+        for x in range(0, pix.width, max(1, pix.width // samples)):
+            channels = pix.pixel(x, y)[:3]
+            if max(channels) - min(channels) > tolerance:
+                return False
+    return True
+
+# State for `_image_rendering`: the original PyMuPDF methods (captured once and
+# kept, so stale references to the wrappers keep working), how many blocks are
+# active, and each thread's requested image settings.
+_image_patch_lock = threading.Lock()
+_image_patch_count = 0
+_image_patch_originals: dict = {}
+_image_settings = threading.local()
+
+def _active_image_settings() -> Union[tuple, None]:
+    stack = getattr(_image_settings, "stack", None)
+    return stack[-1] if stack else None
+
+def _get_pixmap_with_settings(page, *args, **kwargs):
+    import fitz
+
+    get_pixmap = _image_patch_originals["get_pixmap"]
+    settings = _active_image_settings()
+    if settings is None or settings[0] == "rgb":
+        return get_pixmap(page, *args, **kwargs)
+    kwargs["alpha"] = False
+    if settings[0] == "gray":
+        kwargs["colorspace"] = fitz.csGRAY
+        return get_pixmap(page, *args, **kwargs)
+    pix = get_pixmap(page, *args, **kwargs)
+    return fitz.Pixmap(fitz.csGRAY, pix) if _is_grayscale(pix) else pix
+
+def _save_with_settings(pix, *args, **kwargs):
+    settings = _active_image_settings()
+    if settings is not None and settings[1] is not None:
+        kwargs.setdefault("jpg_quality", settings[1])
+    return _image_patch_originals["save"](pix, *args, **kwargs)
+
+@contextlib.contextmanager
+def _image_rendering(image_colorspace: str = "rgb", image_quality: Union[int, None] = None):
+    """
+    Make pymupdf4llm render and encode images with the requested settings.
+    pymupdf4llm has no hook for its image writer, so `Page.get_pixmap` and `Pixmap.save`
+    are wrapped process-wide while any block is active. Settings are per thread and the
+    wrappers defer to the originals outside a block, but this is not fully thread-safe:
+    other code calling these methods meanwhile still goes through the wrappers.
+    """
+    global _image_patch_count
+    if image_colorspace == "rgb" and image_quality is None:
+        yield
+        return
+
+    import fitz
+
+    if not hasattr(_image_settings, "stack"):
+        _image_settings.stack = []
+    settings = (image_colorspace, image_quality)
+    _image_settings.stack.append(settings)
+    with _image_patch_lock:
+        _image_patch_originals.setdefault("get_pixmap", fitz.Page.get_pixmap)
+        _image_patch_originals.setdefault("save", fitz.Pixmap.save)
+        if _image_patch_count == 0:
+            fitz.Page.get_pixmap = _get_pixmap_with_settings
+            fitz.Pixmap.save = _save_with_settings
+        _image_patch_count += 1
+    try:
+        yield
+    finally:
+        with _image_patch_lock:
+            _image_patch_count -= 1
+            if _image_patch_count == 0:
+                fitz.Page.get_pixmap = _image_patch_originals["get_pixmap"]
+                fitz.Pixmap.save = _image_patch_originals["save"]
+        # Remove this block's own entry, so blocks may also exit out of order.
+        stack = _image_settings.stack
+        del stack[next(i for i in reversed(range(len(stack))) if stack[i] is settings)]
+
+def _render_subset(
     pdf_path: str,
+    subset: List[int],
+    kwargs: dict,
+    image_options: dict
+) -> List[dict]:
+    """
+    Render a subset of pages as page chunks in a worker process.
+    Each worker opens its own document handle; fitz documents cannot be shared across processes.
+    """
+    import fitz
+    import pymupdf4llm
+
+    doc = fitz.open(pdf_path)
+    try:
+        with _image_rendering(**image_options):
+            return pymupdf4llm.to_markdown(doc, pages=subset, page_chunks=True, **kwargs)
+    finally:
+        doc.close()
+
+def parse_pdf_to_markdown(
+    pdf_path: Union[str, None] = None,
     pages: Union[List[int], None] = None,
     write_images: bool = False,
     image_path: str = "images",
     dpi: int = 150,
-    image_format: str = "png",
-    page_chunks: bool = False
+    image_format: str = "jpg",
+    page_chunks: bool = False,
+    num_workers: int = min(os.cpu_count() or 1, 4),
+    doc: Union[fitz.Document, None] = None,
+    use_cache: bool = False,
+    image_colorspace: str = "rgb",
+    image_quality: Union[int, None] = None,
+    mode: str = "markdown"
 ) -> Union[str, List[dict]]:
     """
     Convert a PDF file to Markdown using PyMuPDF4llm.
+    Pass either `pdf_path` or an already-open `doc`; the README describes the other options.
     """
-    doc = fitz.open(pdf_path)
-    total_pages = len(doc)
-    
-    if pages:
-        pages = [p for p in pages if 0 <= p < total_pages]
-        if not pages:
-            raise ValueError(f"No valid pages specified. Document has {total_pages} pages.")
+    import fitz
+    import pymupdf4llm
+
+    if (pdf_path is None) == (doc is None):
+        raise ValueError("Specify exactly one of 'pdf_path' or 'doc'.")
+    if image_colorspace not in IMAGE_COLORSPACES:
+        raise ValueError(f"image_colorspace must be one of {IMAGE_COLORSPACES}, got {image_colorspace!r}.")
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, got {mode!r}.")
+    if image_quality is not None and not 0 <= image_quality <= 100:
+        raise ValueError(f"image_quality must be between 0 and 100, got {image_quality}.")
+    if mode == "plain" and write_images:
+        raise ValueError("write_images is not supported with mode='plain'.")
+
+    source_path = pdf_path if doc is None else doc.name
+    # The key describes the file on disk, so a document with unsaved edits must bypass
+    # it, and decrypted text from an unlocked document must not be written out in clear.
+    cacheable = not write_images and (
+        doc is None or not (doc.is_dirty or doc.metadata.get("encryption"))
+    )
+    if use_cache and cacheable and os.path.isfile(source_path):
+        cache_file = _cache_file(source_path, dict(
+            pages=pages,
+            dpi=dpi,
+            image_format=image_format,
+            page_chunks=page_chunks,
+            mode=mode
+        ))
+        cached = _read_cache(cache_file)
+        if cached is not None:
+            return cached
+        md_output = parse_pdf_to_markdown(
+            pdf_path,
+            pages=pages,
+            image_path=image_path,
+            dpi=dpi,
+            image_format=image_format,
+            page_chunks=page_chunks,
+            num_workers=num_workers,
+            doc=doc,
+            mode=mode
+        )
+        try:
+            _write_cache(cache_file, md_output)
+        except OSError:
+            pass  # an unwritable cache must not discard a finished extraction
+        return md_output
+
+    owns_doc = doc is None
+    if owns_doc:
+        doc = fitz.open(pdf_path)
     else:
+        pdf_path = doc.name
+    try:
+        total_pages = doc.page_count
+
+        if pages:
+            # Drop duplicate and out-of-range pages, keeping the caller's order;
+            # dict.fromkeys dedupes in C before the range filter runs.
+            pages = [p for p in dict.fromkeys(pages) if 0 <= p < total_pages]
+            if not pages:
+                raise ValueError(f"No valid pages specified. Document has {total_pages} pages.")
+        else:
+            # Let pymupdf4llm select all pages itself on the sequential path.
+            pages = None
+
+        if mode == "plain":
+            selected = pages if pages is not None else range(total_pages)
+            texts = [doc.load_page(p).get_text() for p in selected]
+            if page_chunks:
+                return [{"text": t, "metadata": {"page": p + 1}} for p, t in zip(selected, texts)]
+            return "\n\n".join(texts)
+
+        if write_images and dpi > 200:
+            warnings.warn(
+                f"dpi={dpi} will produce ~{(dpi / 150) ** 2:.1f}x more pixels than 150-DPI; "
+                "rendering and image encode cost scale with pixel count",
+                stacklevel=2
+            )
+
+        options = dict(
+            write_images=write_images,
+            image_path=image_path,
+            dpi=dpi,
+            image_format=image_format
+        )
+        # Images are only rendered when written, and quality only applies to JPEG,
+        # so leave pymupdf4llm untouched otherwise.
+        image_options = dict(
+            image_colorspace=image_colorspace,
+            image_quality=image_quality if image_format.lower() in ("jpg", "jpeg") else None
+        ) if write_images else {}
+
+        # Workers re-open the file by path without a password, so in-memory, modified
+        # and encrypted documents stay sequential. Encryption is read from metadata:
+        # querying `needs_pass` after `authenticate` breaks decryption of the handle.
+        # Reflowable documents (TXT, HTML, EPUB) are re-laid out by each worker, which
+        # changes their page numbering.
+        num_pages = len(pages) if pages else total_pages
+        num_workers = min(num_workers, num_pages)
+        sequential = num_workers <= 1 or num_pages < 4
+        encrypted = bool(doc.metadata.get("encryption"))
+        if (sequential or doc.is_dirty or encrypted or doc.is_reflowable
+                or not os.path.isfile(pdf_path)):
+            with _image_rendering(**image_options):
+                return pymupdf4llm.to_markdown(doc, pages=pages, page_chunks=page_chunks, **options)
+
+        # Scan header font sizes once here rather than over the whole document in
+        # every worker, and keep the workers' progress bars off stdout.
+        worker_options = dict(
+            options,
+            hdr_info=pymupdf4llm.IdentifyHeaders(doc),
+            show_progress=False
+        )
+    finally:
+        if owns_doc:
+            doc.close()
+
+    if pages is None:
         pages = list(range(total_pages))
-    
-    md_output = pymupdf4llm.to_markdown(
-        doc,
-        pages=pages,
-        write_images=write_images,
-        image_path=image_path,
-        dpi=dpi,
-        image_format=image_format,
-        page_chunks=page_chunks
-    )
-    
-    return md_output
+    if write_images and image_path:
+        # Every worker would otherwise run pymupdf4llm's racy check-then-mkdir.
+        os.makedirs(image_path, exist_ok=True)
+
+    # Shard by position so results can be merged back in the requested page order.
+    positions = [list(range(i, len(pages), num_workers)) for i in range(num_workers)]
+    results: List[dict] = [None] * len(pages)
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [
+            executor.submit(_render_subset, pdf_path, [pages[i] for i in shard], worker_options, image_options)
+            for shard in positions
+        ]
+        for shard, future in zip(positions, futures):
+            for i, chunk in zip(shard, future.result()):
+                results[i] = chunk
 
-def save_markdown(md_output: Union[str, List[dict]], output_path: str, page_chunks: bool = False) -> None:
+    if page_chunks:
+        return results
+    return "".join(chunk["text"] for chunk in results)
+
+def save_markdown(
+    md_output: Union[str, List[dict]],
+    output_path: str,
+    page_chunks: bool = False,
+    split_files: bool = False
+) -> None:
     """
     Save the Markdown output to a file.
+    With `page_chunks` and `split_files`, `output_path` is a directory that receives
+    one `page_NNNNN.md` file per chunk; `split_files` without page chunks raises ValueError.
     """
     output_file = pathlib.Path(output_path)
+
+    if split_files and not (page_chunks and isinstance(md_output, list)):
+        raise ValueError("split_files requires page_chunks=True and a list of page chunks.")
+    if split_files:
+        output_file.mkdir(parents=True, exist_ok=True)
+        for page_dict in md_output:
+            page_file = output_file / f"page_{page_dict['metadata']['page']:05d}.md"
+            page_file.write_text(page_dict["text"], encoding="utf-8")
+        return
+
     output_file.parent.mkdir(parents=True, exist_ok=True)
 
     if page_chunks and isinstance(md_output, list):
-        full_md = ""
-        for page_dict in md_output:
-            page_number = page_dict.get("metadata", {}).get("page", "unknown")
-            full_md += f"# Page {page_number}\n\n{page_dict.get('text', '')}\n\n"
-        md_output = full_md
+        # Stream page by page so the full document is never held in memory as one string.
+        with output_file.open("w", encoding="utf-8", buffering=1 << 20) as f:
+            f.writelines(
+                f"# Page {d.get('metadata', {}).get('page', 'unknown')}\n\n{d.get('text', '')}\n\n"
+                for d in md_output
+            )
+        return
 
     output_file.write_text(md_output, encoding="utf-8")
 
-def main() -> None:
+def _process_one(
+    pdf_path: str,
+    output_path: str,
+    options: dict,
+    split_files: bool = False
+) -> str:
+    """
+    Convert and save a single PDF; used by the CLI's directory mode.
+    Runs in a worker process, so it must stay at module level to be picklable.
+    """
+    md_output = parse_pdf_to_markdown(pdf_path, num_workers=1, **options)
+    save_markdown(md_output, output_path, page_chunks=options["page_chunks"], split_files=split_files)
+    return pdf_path
+
+def main(argv: Union[List[str], None] = None) -> None:
     parser_cli = argparse.ArgumentParser(
-        description="Parse a PDF file into Markdown using PyMuPDF4llm."
+        description="Parse a PDF file, or a directory of PDF files, into Markdown using PyMuPDF4llm."
+    )
+    parser_cli.add_argument("input", help="Input PDF file path, or a directory of PDF files")
+    parser_cli.add_argument(
+        "output",
+        help="Output Markdown file path, or an output directory when input is a directory"
     )
-    parser_cli.add_argument("input", help="Input PDF file path")
-    parser_cli.add_argument("output", help="Output Markdown file path")
     parser_cli.add_argument(
         "--pages",
         nargs="+",
@@ -78,12 +404,22 @@ def main() -> None:
         action="store_true",
         help="Output the Markdown as page chunks (each page as a separate dictionary)"
     )
+    parser_cli.add_argument(
+        "--split-files",
+        action="store_true",
+        help="Treat output as a directory and write one file per page (requires --page-chunks)"
+    )
     parser_cli.add_argument(
         "--dpi",
         type=int,
         default=150,
         help="Resolution (dpi) for extracted images (default: 150)"
     )
+    parser_cli.add_argument(
+        "--dpi-preset",
+        choices=sorted(DPI_PRESETS),
+        help="Named image resolution that overrides --dpi (web=96, screen=150, print=300)"
+    )
     parser_cli.add_argument(
         "--image-path",
         default="images",
@@ -91,22 +427,116 @@ def main() -> None:
     )
     parser_cli.add_argument(
         "--image-format",
-        default="png",
-        help="Format for extracted images (default: 'png')"
+        default="jpg",
+        help="Format for extracted images; use 'png' for line-art where lossless matters (default: 'jpg')"
+    )
+    parser_cli.add_argument(
+        "--image-quality",
+        type=int,
+        default=85,
+        help="JPEG quality (0-100) for extracted images (default: 85)"
+    )
+    parser_cli.add_argument(
+        "--image-colorspace",
+        choices=IMAGE_COLORSPACES,
+        default="rgb",
+        help="Colorspace for extracted images; 'gray' and 'auto' write smaller single-channel images (default: 'rgb')"
+    )
+    parser_cli.add_argument(
+        "--mode",
+        choices=MODES,
+        default="markdown",
+        help="'plain' extracts raw page text without Markdown structure, which is much faster (default: 'markdown')"
+    )
+    parser_cli.add_argument(
+        "--use-cache",
+        action="store_true",
+        help="Reuse results cached from a previous run on the same unchanged file"
+    )
+    args = parser_cli.parse_args(argv)
+    if args.split_files and not args.page_chunks:
+        parser_cli.error("--split-files requires --page-chunks")
+    if not 0 <= args.image_quality <= 100:
+        parser_cli.error("--image-quality must be between 0 and 100")
+    if args.dpi_preset:
+        args.dpi = DPI_PRESETS[args.dpi_preset]
+    options = dict(
+        pages=args.pages,
+        write_images=args.write_images,
+        image_path=args.image_path,
+        dpi=args.dpi,
+        image_format=args.image_format,
+        page_chunks=args.page_chunks,
+        use_cache=args.use_cache,
+        image_colorspace=args.image_colorspace,
+        image_quality=args.image_quality,
+        mode=args.mode
     )
-    args = parser_cli.parse_args()
 
     try:
-        md_output = parse_pdf_to_markdown(
-            pdf_path=args.input,
-            pages=args.pages,
-            write_images=args.write_images,
-            image_path=args.image_path,
-            dpi=args.dpi,
-            image_format=args.image_format,
-            page_chunks=args.page_chunks
+        input_path = pathlib.Path(args.input)
+        if input_path.is_dir():
+            # One worker per document; workers are reused across files.
+            pdf_files = sorted(
+                f for f in input_path.iterdir() if f.is_file() and f.suffix.lower() == ".pdf"
+            )
+            if not pdf_files:
+                raise ValueError(f"No PDF files found in '{args.input}'.")
+            if args.write_images:
+                # Create the shared image folder up front; pymupdf4llm's own
+                # check-then-mkdir races when several workers start at once.
+                os.makedirs(args.image_path, exist_ok=True)
+            output_dir = pathlib.Path(args.output)
+            split_pages = args.split_files and args.page_chunks
+            # Inputs like a.pdf and a.PDF map to the same output; convert the first
+            # and report the others rather than silently overwriting it.
+            outputs = {}
+            failed = []
+            for f in pdf_files:
+                output_path = str(output_dir / (f.stem if split_pages else f"{f.stem}.md"))
+                if output_path in outputs:
+                    failed.append(f)
+                    print(f"An error occurred processing '{f}': output '{output_path}' "
+                          f"is already used by '{outputs[output_path]}'")
+                else:
+                    outputs[output_path] = f
+            with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 8)) as executor:
+                futures = {
+                    pdf_file: executor.submit(
+                        _process_one,
+                        str(pdf_file),
+                        output_path,
+                        options,
+                        args.split_files
+                    )
+                    for output_path, pdf_file in outputs.items()
+                }
+                # Report failures per file so one bad PDF does not abort the batch.
+                for pdf_file, future in futures.items():
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failed.append(pdf_file)
+                        print(f"An error occurred processing '{pdf_file}': {e}")
+                    else:
+                        print(f"Successfully processed '{pdf_file}'.")
+            if len(failed) < len(pdf_files):
+                print(f"Output saved to '{args.output}'.")
+            if failed:
+                print(f"{len(failed)} of {len(pdf_files)} files could not be processed.")
+                sys.exit(1)
+            return
+
+        import fitz
+
+        with fitz.open(args.input) as doc:
+            md_output = parse_pdf_to_markdown(doc=doc, **options)
+        save_markdown(
+            md_output,
+            args.output,
+            page_chunks=args.page_chunks,
+            split_files=args.split_files
         )
-        save_markdown(md_output, args.output, page_chunks=args.page_chunks)
         print(f"Successfully processed '{args.input}'.")
         print(f"Output saved to '{args.output}'.")
     except Exception as e:
@@ -58,4 +58,31 @@ def test_save_markdown_with_chunks(tmp_path: pathlib.Path):
     parser.save_markdown(test_chunks, str(output_path), page_chunks=True)
     content = output_path.read_text(encoding="utf-8")
     assert "# Page 1" in content, "Output should contain page 1 header"
-    assert "# Page 2" in content, "Output should contain page 2 header"
\ No newline at end of file
+    assert "# Page 2" in content, "Output should contain page 2 header"
+
+def test_high_dpi_warns(test_pdf_path: pathlib.Path, tmp_path: pathlib.Path):
+    """Test that image extraction above 200 DPI emits a warning."""
+    with pytest.warns(UserWarning, match="dpi=300") as record:
+        parser.parse_pdf_to_markdown(
+            str(test_pdf_path),
+            write_images=True,
+            image_path=str(tmp_path / "images"),
+            dpi=300
+        )
+    assert record[0].filename == __file__, "Warning should point at the caller"
+
+def test_save_markdown_split_files(tmp_path: pathlib.Path):
+    """Test saving page chunks as one file per page."""
+    output_dir = tmp_path / "pages"
+    test_chunks = [
+        {"text": "Page 1 content", "metadata": {"page": 1}},
+        {"text": "Page 2 content", "metadata": {"page": 2}},
+    ]
+    parser.save_markdown(test_chunks, str(output_dir), page_chunks=True, split_files=True)
+    assert (output_dir / "page_00001.md").read_text(encoding="utf-8") == "Page 1 content"
+    assert (output_dir / "page_00002.md").read_text(encoding="utf-8") == "Page 2 content"
+
+def test_save_markdown_split_files_requires_chunks(tmp_path: pathlib.Path):
+    """Test that split_files without page chunks is rejected."""
+    with pytest.raises(ValueError):
+        parser.save_markdown("# Test Markdown", str(tmp_path / "pages"), split_files=True)
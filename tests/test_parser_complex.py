@@ -1,6 +1,8 @@
 import pathlib
+import random
 import pytest
 import fitz  # PyMuPDF
+import pymupdf4llm
 from pdf_parser import parser
 from typing import List, Union
 
@@ -119,4 +121,403 @@ def test_save_markdown_with_chunks(tmp_path: pathlib.Path):
     parser.save_markdown(test_chunks, str(output_path), page_chunks=True)
     content = output_path.read_text(encoding="utf-8")
     assert "# Page 1" in content, "Output should contain header for page 1"
-    assert "# Page 2" in content, "Output should contain header for page 2"
\ No newline at end of file
+    assert "# Page 2" in content, "Output should contain header for page 2"
+
+def test_parallel_extraction_matches_sequential(tmp_path: pathlib.Path):
+    """
+    Test multi-process extraction.
+    This test creates a six-page PDF and verifies that splitting the pages across
+    worker processes yields the same output, in the same page order, as a single process.
+    """
+    pdf_path = tmp_path / "parallel.pdf"
+    doc = fitz.open()
+    for i in range(6):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Parallel page {i + 1}")
+    doc.save(str(pdf_path))
+    doc.close()
+
+    pages = [5, 0, 3, 1, 4, 2]
+    sequential = parser.parse_pdf_to_markdown(str(pdf_path), pages=pages, num_workers=1)
+    parallel = parser.parse_pdf_to_markdown(str(pdf_path), pages=pages, num_workers=3)
+    assert parallel == sequential, "Parallel output should match sequential output"
+
+    chunks = parser.parse_pdf_to_markdown(str(pdf_path), pages=pages, page_chunks=True, num_workers=3)
+    assert [c["metadata"]["page"] for c in chunks] == [p + 1 for p in pages], "Chunks should follow requested page order"
+
+
+def test_reflowable_document_stays_sequential(tmp_path: pathlib.Path):
+    """
+    Test multi-page extraction of a reflowable document.
+    Workers would re-lay out a text file and lose the parent's page numbering, so this
+    test verifies that a multi-page .txt input converts with several workers requested.
+    """
+    txt_path = tmp_path / "long.txt"
+    txt_path.write_text("".join(f"Line {i}\n" for i in range(600)), encoding="utf-8")
+    md_output = parser.parse_pdf_to_markdown(str(txt_path), num_workers=2)
+    assert "Line 10" in md_output and "Line 599" in md_output, "Expected text missing"
+
+
+def test_duplicate_pages_extracted_once(tmp_path: pathlib.Path):
+    """
+    Test page deduplication.
+    This test requests the same page several times, plus an out-of-range page,
+    and verifies that each valid page is extracted exactly once in the requested order.
+    """
+    pdf_path = tmp_path / "duplicates.pdf"
+    doc = fitz.open()
+    for i in range(3):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Duplicate test page {i + 1}")
+    doc.save(str(pdf_path))
+    doc.close()
+
+    md_chunks = parser.parse_pdf_to_markdown(str(pdf_path), pages=[2, 0, 2, 7, 0], page_chunks=True)
+    assert [c["metadata"]["page"] for c in md_chunks] == [3, 1], "Each valid page should appear once"
+
+
+def test_extract_from_open_document(tmp_path: pathlib.Path):
+    """
+    Test extraction from an already-open document.
+    This test opens a PDF once, extracts two different page ranges from it,
+    and verifies that the document is still usable afterwards.
+    """
+    pdf_path = tmp_path / "open_doc.pdf"
+    doc = fitz.open()
+    for i in range(2):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Open document page {i + 1}")
+    doc.save(str(pdf_path))
+    doc.close()
+
+    doc = fitz.open(str(pdf_path))
+    first = parser.parse_pdf_to_markdown(doc=doc, pages=[0])
+    second = parser.parse_pdf_to_markdown(doc=doc, pages=[1])
+    assert "Open document page 1" in first, "First page text missing"
+    assert "Open document page 2" in second, "Second page text missing"
+    assert not doc.is_closed, "A caller-supplied document should be left open"
+    doc.close()
+
+    with pytest.raises(ValueError):
+        parser.parse_pdf_to_markdown(str(pdf_path), doc=fitz.open(str(pdf_path)))
+
+
+def test_extract_from_authenticated_document(tmp_path: pathlib.Path):
+    """
+    Test extraction from an unlocked encrypted document.
+    Worker processes cannot re-open an encrypted file without its password, so this
+    test verifies that such a document is processed in the calling process instead.
+    """
+    pdf_path = tmp_path / "encrypted.pdf"
+    doc = fitz.open()
+    for i in range(4):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Secret page {i + 1}")
+    doc.save(str(pdf_path), encryption=fitz.PDF_ENCRYPT_AES_256, owner_pw="owner", user_pw="user")
+    doc.close()
+
+    doc = fitz.open(str(pdf_path))
+    assert doc.authenticate("user"), "Password should unlock the document"
+    md_output = parser.parse_pdf_to_markdown(doc=doc, num_workers=2)
+    doc.close()
+    for i in range(4):
+        assert f"Secret page {i + 1}" in md_output, f"Page {i + 1} text missing"
+
+
+def test_cached_extraction(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    """
+    Test the on-disk result cache.
+    This test parses a PDF twice with use_cache=True and verifies that the second
+    call is served from the cache, and that modifying the file invalidates the entry.
+    """
+    monkeypatch.setattr(parser, "CACHE_DIR", tmp_path / "cache")
+    pdf_path = tmp_path / "cached.pdf"
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Cached content")
+    doc.save(str(pdf_path))
+    doc.close()
+
+    first = parser.parse_pdf_to_markdown(str(pdf_path), use_cache=True)
+    assert "Cached content" in first, "Expected text not found in output"
+    assert len(list((tmp_path / "cache").iterdir())) == 1, "Result should be cached"
+
+    calls = []
+    monkeypatch.setattr(pymupdf4llm, "to_markdown", lambda *a, **k: calls.append(a))
+    assert parser.parse_pdf_to_markdown(str(pdf_path), use_cache=True) == first
+    assert not calls, "Cache hit should not re-parse the document"
+
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Changed content, longer than before")
+    doc.save(str(pdf_path))
+    doc.close()
+    parser.parse_pdf_to_markdown(str(pdf_path), use_cache=True)
+    assert calls, "A modified file should miss the cache"
+
+
+def test_cache_skips_unsaved_document(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    """
+    Test that unsaved edits never reach the cache.
+    This test edits an open document without saving it and verifies that its output
+    is not stored under the key of the unchanged file on disk.
+    """
+    monkeypatch.setattr(parser, "CACHE_DIR", tmp_path / "cache")
+    pdf_path = tmp_path / "dirty.pdf"
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Saved content")
+    doc.save(str(pdf_path))
+    doc.close()
+
+    doc = fitz.open(str(pdf_path))
+    doc[0].insert_text((72, 144), "UNSAVED EDIT")
+    edited = parser.parse_pdf_to_markdown(doc=doc, use_cache=True)
+    doc.close()
+    assert "UNSAVED EDIT" in edited, "Edited text should be extracted from the open document"
+
+    clean = parser.parse_pdf_to_markdown(str(pdf_path), use_cache=True)
+    assert "UNSAVED EDIT" not in clean, "Unsaved edits must not be served from the cache"
+
+
+def test_cache_error_paths(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    """
+    Test cache failures and sensitive documents.
+    This test verifies that an unwritable cache still returns the result, that a
+    corrupt entry is treated as a miss and replaced, and that an unlocked encrypted
+    document is never written to the cache.
+    """
+    pdf_path = tmp_path / "cache_errors.pdf"
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Cache error content")
+    doc.save(str(pdf_path))
+    doc.close()
+
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+    monkeypatch.setattr(parser, "CACHE_DIR", blocker / "cache")
+    md_output = parser.parse_pdf_to_markdown(str(pdf_path), use_cache=True)
+    assert "Cache error content" in md_output, "Result should survive a failed cache write"
+
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setattr(parser, "CACHE_DIR", cache_dir)
+    parser.parse_pdf_to_markdown(str(pdf_path), use_cache=True)
+    (entry,) = cache_dir.iterdir()
+    entry.write_bytes(b"truncated")
+    assert "Cache error content" in parser.parse_pdf_to_markdown(str(pdf_path), use_cache=True)
+    assert entry.read_bytes() != b"truncated", "A corrupt entry should be overwritten"
+
+    encrypted_path = tmp_path / "secret.pdf"
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Top secret")
+    doc.save(str(encrypted_path), encryption=fitz.PDF_ENCRYPT_AES_256, owner_pw="owner", user_pw="user")
+    doc.close()
+    doc = fitz.open(str(encrypted_path))
+    doc.authenticate("user")
+    assert "Top secret" in parser.parse_pdf_to_markdown(doc=doc, use_cache=True)
+    doc.close()
+    assert len(list(cache_dir.iterdir())) == 1, "Decrypted text must not be cached"
+
+
+def test_grayscale_image_extraction(tmp_path: pathlib.Path):
+    """
+    Test grayscale image extraction.
+    This test embeds a gray image in a PDF and verifies that image_colorspace="gray"
+    and "auto" write it as a single-channel image, while the default keeps RGB.
+    """
+    pdf_path = tmp_path / "image.pdf"
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 200, 200), False)
+    pix.set_rect(pix.irect, (128, 128, 128))
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Image page")
+    page.insert_image(fitz.Rect(72, 100, 372, 400), pixmap=pix)
+    doc.save(str(pdf_path))
+    doc.close()
+
+    for colorspace, channels in (("rgb", 3), ("gray", 1), ("auto", 1)):
+        image_dir = tmp_path / colorspace
+        parser.parse_pdf_to_markdown(
+            str(pdf_path),
+            write_images=True,
+            image_path=str(image_dir),
+            image_colorspace=colorspace
+        )
+        images = list(image_dir.iterdir())
+        assert images, "Expected an extracted image"
+        assert fitz.Pixmap(str(images[0])).n == channels, f"Unexpected channel count for {colorspace}"
+
+
+def test_cli_directory_mode(tmp_path: pathlib.Path):
+    """
+    Test the CLI's directory mode.
+    This test converts a folder of PDFs in one invocation and verifies that each
+    input produces its own Markdown file in the output directory.
+    """
+    input_dir = tmp_path / "pdfs"
+    input_dir.mkdir()
+    for name in ("alpha", "beta"):
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Document {name}")
+        doc.save(str(input_dir / f"{name}.pdf"))
+        doc.close()
+
+    output_dir = tmp_path / "markdown"
+    parser.main([str(input_dir), str(output_dir)])
+    for name in ("alpha", "beta"):
+        content = (output_dir / f"{name}.md").read_text(encoding="utf-8")
+        assert f"Document {name}" in content, f"Expected text missing for {name}"
+
+
+def test_cli_directory_mode_continues_after_failure(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture):
+    """
+    Test the CLI's directory mode with a broken input.
+    This test mixes an unreadable PDF with valid ones (including an upper-case .PDF
+    extension) and verifies that the valid files are still converted, the failure is
+    reported, and the run exits with an error status.
+    """
+    input_dir = tmp_path / "pdfs"
+    input_dir.mkdir()
+    for name in ("alpha.pdf", "GAMMA.PDF"):
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Document {name}")
+        doc.save(str(input_dir / name))
+        doc.close()
+    (input_dir / "broken.pdf").write_bytes(b"not a pdf")
+
+    output_dir = tmp_path / "markdown"
+    with pytest.raises(SystemExit) as excinfo:
+        parser.main([str(input_dir), str(output_dir)])
+    assert excinfo.value.code == 1, "A failed file should make the run exit with status 1"
+    assert "Document alpha.pdf" in (output_dir / "alpha.md").read_text(encoding="utf-8")
+    assert "Document GAMMA.PDF" in (output_dir / "GAMMA.md").read_text(encoding="utf-8")
+    assert "broken.pdf" in capsys.readouterr().out, "The failing file should be reported"
+
+
+def test_cli_directory_mode_duplicate_outputs(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture):
+    """
+    Test the CLI's directory mode with inputs that share an output name.
+    This test converts a.pdf and a.PDF and verifies that the second is reported as a
+    failure instead of silently overwriting the first file's output.
+    """
+    input_dir = tmp_path / "pdfs"
+    input_dir.mkdir()
+    for name in ("a.PDF", "a.pdf"):
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Document {name}")
+        doc.save(str(input_dir / name))
+        doc.close()
+
+    output_dir = tmp_path / "markdown"
+    with pytest.raises(SystemExit):
+        parser.main([str(input_dir), str(output_dir)])
+    assert "Document a.PDF" in (output_dir / "a.md").read_text(encoding="utf-8")
+    out = capsys.readouterr().out
+    assert "already used by" in out, "The colliding file should be reported"
+    assert "Output saved" in out, "Output should be reported when a file succeeded"
+
+    capsys.readouterr()
+    (input_dir / "a.PDF").write_bytes(b"not a pdf")
+    (input_dir / "a.pdf").unlink()
+    with pytest.raises(SystemExit):
+        parser.main([str(input_dir), str(tmp_path / "none")])
+    assert "Output saved" not in capsys.readouterr().out, "No output when every file failed"
+
+
+def test_plain_text_mode(tmp_path: pathlib.Path):
+    """
+    Test the plain-text fast path.
+    This test creates a two-page PDF and verifies that mode="plain" returns the raw
+    page text, both as a single string and as page chunks with 1-based page numbers.
+    """
+    pdf_path = tmp_path / "plain.pdf"
+    doc = fitz.open()
+    for i in range(2):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Plain page {i + 1}")
+    doc.save(str(pdf_path))
+    doc.close()
+
+    text = parser.parse_pdf_to_markdown(str(pdf_path), mode="plain")
+    assert "Plain page 1" in text and "Plain page 2" in text, "Expected page text missing"
+
+    chunks = parser.parse_pdf_to_markdown(str(pdf_path), pages=[1], page_chunks=True, mode="plain")
+    assert len(chunks) == 1, "Expected a single page chunk"
+    assert chunks[0]["metadata"]["page"] == 2, "Chunk page metadata incorrect"
+    assert "Plain page 2" in chunks[0]["text"], "Page 2 text missing in chunk"
+
+    with pytest.raises(ValueError):
+        parser.parse_pdf_to_markdown(str(pdf_path), mode="plain", write_images=True)
+
+
+def test_image_rendering_restores_pymupdf(tmp_path: pathlib.Path):
+    """
+    Test that the image-rendering wrappers are always removed.
+    This test enters two image-rendering blocks and exits them out of order, then
+    verifies that PyMuPDF's original methods are back in place.
+    """
+    get_pixmap = fitz.Page.get_pixmap
+    save = fitz.Pixmap.save
+    first = parser._image_rendering("gray", 85)
+    second = parser._image_rendering("rgb", 85)
+    first.__enter__()
+    second.__enter__()
+    first.__exit__(None, None, None)
+    assert fitz.Page.get_pixmap is not get_pixmap, "Wrappers should stay while a block is active"
+    second.__exit__(None, None, None)
+    assert fitz.Page.get_pixmap is get_pixmap, "Page.get_pixmap should be restored"
+    assert fitz.Pixmap.save is save, "Pixmap.save should be restored"
+
+
+def test_image_rendering_stale_wrapper_still_works(tmp_path: pathlib.Path):
+    """
+    Test that a wrapper captured inside an image-rendering block keeps working.
+    This test keeps a bound get_pixmap from inside a "gray" block and verifies that
+    calling it after the block has exited renders normally with the original method.
+    """
+    doc = fitz.open()
+    page = doc.new_page()
+    with parser._image_rendering("gray", 85):
+        render = page.get_pixmap
+    pix = render(dpi=10)
+    assert pix.n == 3, "Outside a block the wrapper should render with the original settings"
+    doc.close()
+
+
+def test_jpeg_image_quality(tmp_path: pathlib.Path):
+    """
+    Test JPEG image extraction.
+    This test embeds a noisy image in a PDF and verifies that images are written as
+    .jpg by default and that a lower image_quality produces a smaller file.
+    """
+    pdf_path = tmp_path / "noise.pdf"
+    noise = random.Random(0).randbytes(300 * 300 * 3)
+    pix = fitz.Pixmap(fitz.csRGB, 300, 300, noise, False)
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_image(fitz.Rect(72, 72, 372, 372), pixmap=pix)
+    doc.save(str(pdf_path))
+    doc.close()
+
+    sizes = {}
+    for quality in (10, 95):
+        image_dir = tmp_path / f"q{quality}"
+        parser.parse_pdf_to_markdown(
+            str(pdf_path),
+            write_images=True,
+            image_path=str(image_dir),
+            image_quality=quality
+        )
+        images = list(image_dir.iterdir())
+        assert len(images) == 1, "Expected one extracted image"
+        assert images[0].suffix == ".jpg", "Images should default to JPEG"
+        sizes[quality] = images[0].stat().st_size
+    assert sizes[10] < sizes[95], "Lower quality should produce a smaller file"
+
+    with pytest.raises(ValueError):
+        parser.parse_pdf_to_markdown(str(pdf_path), write_images=True, image_quality=101)